@@ -0,0 +1,497 @@
+# Copyright 2020-2020 the openage authors. See copying.md for legal info.
+#
+# cython: profile=False
+
+"""
+Reading of prepared data format members for GenieStructure.read().
+"""
+
+from functools import lru_cache
+import struct
+
+from ...value_object.read.member_access import READ_GEN, READ_UNKNOWN, SKIP
+from ...value_object.read.read_members import (IncludeMembers, ContinueReadMember,
+                                               SubdataMember, EnumLookupMember)
+from ...value_object.read.value_members import ContainerMember, ArrayMember, IntMember, FloatMember,\
+    StringMember, BooleanMember, IDMember, BitfieldMember
+from ...value_object.read.value_members import MemberTypes as StorageType
+
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_GET_SIZE
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+from libc.math cimport isfinite
+from libc.string cimport memchr
+
+
+# kinds of members in the prepared data format.
+# these have the same values as the kinds in genie_structure.py,
+# see _member_entry() there.
+cdef enum member_kind:
+    GROUP_MEMBER = 0
+    MULTISUBTYPE_MEMBER = 1
+    PRIMITIVE_MEMBER = 2
+    CUSTOM_MEMBER = 3
+    PRIMITIVE_RUN = 4
+    SKIPPED_MEMBER = 5
+
+
+# storage types that primitive arrays can be read into
+ARRAY_STORAGE_TYPES = (StorageType.STRING_MEMBER,
+                       StorageType.ARRAY_INT,
+                       StorageType.ARRAY_FLOAT,
+                       StorageType.ARRAY_BOOL,
+                       StorageType.ARRAY_ID,
+                       StorageType.ARRAY_STRING)
+
+
+# storage types of primitive arrays and the ValueMember of their elements
+cdef dict ARRAY_MEMBER_TYPES = {
+    StorageType.ARRAY_INT: (IntMember, StorageType.INT_MEMBER),
+    StorageType.ARRAY_FLOAT: (FloatMember, StorageType.FLOAT_MEMBER),
+    StorageType.ARRAY_BOOL: (BooleanMember, StorageType.BOOLEAN_MEMBER),
+    StorageType.ARRAY_ID: (IDMember, StorageType.ID_MEMBER),
+    StorageType.ARRAY_STRING: (StringMember, StorageType.STRING_MEMBER),
+}
+
+
+@lru_cache(maxsize=None)
+def get_packer(count, symbol):
+    """
+    return a precompiled struct for reading count values of type symbol.
+    """
+    return struct.Struct("< %d%s" % (count, symbol))
+
+
+def array_value_member(var_name, offset, var_type, storage_type, result):
+    """
+    create the ArrayMember for the values of a primitive array.
+    """
+    if storage_type not in ARRAY_MEMBER_TYPES:
+        raise Exception("%s at offset %# 08x: Data read via %s "
+                        "cannot be stored as %s;"
+                        " expected %s, %s, %s, %s or %s"
+                        % (var_name, offset, var_type, storage_type,
+                           StorageType.ARRAY_INT,
+                           StorageType.ARRAY_FLOAT,
+                           StorageType.ARRAY_BOOL,
+                           StorageType.ARRAY_ID,
+                           StorageType.ARRAY_STRING))
+
+    member_type, allowed_member_type = ARRAY_MEMBER_TYPES[storage_type]
+
+    # the members for the values are created on first access
+    return ArrayMember(var_name, allowed_member_type, result, member_type)
+
+
+def primitive_value_member(var_name, offset, var_type, storage_type, result):
+    """
+    create the ValueMember for a single primitive value.
+    """
+    if storage_type is StorageType.INT_MEMBER:
+        return IntMember(var_name, result)
+
+    elif storage_type is StorageType.FLOAT_MEMBER:
+        return FloatMember(var_name, result)
+
+    elif storage_type is StorageType.BOOLEAN_MEMBER:
+        return BooleanMember(var_name, result)
+
+    elif storage_type is StorageType.ID_MEMBER:
+        return IDMember(var_name, result)
+
+    raise Exception("%s at offset %# 08x: Data read via %s "
+                    "cannot be stored as %s;"
+                    " expected %s, %s, %s or %s"
+                    % (var_name, offset, var_type, storage_type,
+                       StorageType.INT_MEMBER,
+                       StorageType.FLOAT_MEMBER,
+                       StorageType.BOOLEAN_MEMBER,
+                       StorageType.ID_MEMBER))
+
+
+cdef decode_char_array(bytes data):
+    """
+    decode a char array as utf-8, up to the first \\0 character.
+
+    does the same as util.strings.decode_until_null(),
+    but decodes directly from the buffer of data instead of a copy.
+    """
+    cdef char *chars = PyBytes_AS_STRING(data)
+    cdef Py_ssize_t length = PyBytes_GET_SIZE(data)
+    cdef void *end = memchr(chars, 0, length)
+
+    if end != NULL:
+        length = <char *>end - chars
+
+    return PyUnicode_DecodeUTF8(chars, length, NULL)
+
+
+def read_members(self, raw, Py_ssize_t offset, game_version, target_class, members):
+    """
+    read the given members of the data format from raw at given offset.
+
+    this is the member loop of GenieStructure.read(): the values are
+    stored to self and (offset, generated_value_members) is returned.
+    the members have to be prepared by _member_entry().
+
+    raw can be any object supporting the buffer protocol.
+    """
+    # Members are returned at the end
+    cdef list generated_value_members = []
+
+    # break out of the current reading loop when members don't exist in
+    # source data file
+    cdef bint stop_reading_members = False
+
+    cdef int kind
+    cdef bint is_array
+    cdef bint is_custom_member
+    cdef bint single_type_subdata
+    cdef Py_ssize_t i
+    cdef Py_ssize_t list_len
+    cdef list subdata_value_members
+    cdef list sub_members
+    cdef list gen_members
+    cdef list target_list
+    cdef dict target_dict
+    cdef dict varargs
+
+    for kind, export, var_name, storage_type, var_type, extra in members:
+
+        if stop_reading_members:
+            if kind == PRIMITIVE_MEMBER or kind == SKIPPED_MEMBER:
+                replacement_value = 0
+            else:
+                replacement_value = var_type.get_empty_value()
+
+            setattr(self, var_name, replacement_value)
+            continue
+
+        if kind == SKIPPED_MEMBER:
+            # skipped members are not unpacked, just advance the position
+            _, _, symbol, data_count, packer = extra
+
+            if packer is not None:
+                offset += packer.size
+                continue
+
+            # dynamic length specified by member name
+            data_count = getattr(self, data_count)
+
+            if data_count < 0:
+                raise Exception("invalid length %d < 0 in %s for member '%s'" % (
+                    data_count, var_type, var_name))
+
+            offset += data_count * get_packer(1, symbol).size
+            continue
+
+        if kind == GROUP_MEMBER:
+            if isinstance(var_type, IncludeMembers):
+                # call the read function of the referenced class (cls),
+                # but store the data to the current object (self).
+                offset, gen_members = var_type.cls.read(self, raw, offset,
+                                                        game_version,
+                                                        cls=var_type.cls)
+
+                if export is READ_GEN:
+                    # Push the passed members directly into the list of generated members
+                    generated_value_members.extend(gen_members)
+
+            else:
+                # create new instance of ValueMember,
+                # depending on the storage type.
+                # then save the result as a reference named `var_name`
+                grouped_data = var_type.cls()
+                offset, gen_members = grouped_data.read(raw, offset, game_version)
+
+                setattr(self, var_name, grouped_data)
+
+                if export is READ_GEN:
+                    # Store the data
+                    if storage_type is StorageType.CONTAINER_MEMBER:
+                        # push the members into a ContainerMember
+                        container = ContainerMember(var_name, gen_members)
+
+                        generated_value_members.append(container)
+
+                    elif storage_type is StorageType.ARRAY_CONTAINER:
+                        # create a container for the members first, then push the
+                        # container into an array
+                        container = ContainerMember(var_name, gen_members)
+                        allowed_member_type = StorageType.CONTAINER_MEMBER
+                        array = ArrayMember(var_name, allowed_member_type, [container])
+
+                        generated_value_members.append(array)
+
+                    else:
+                        raise Exception("%s at offset %# 08x: Data read via %s "
+                                        "cannot be stored as %s;"
+                                        " expected %s or %s"
+                                        % (var_name, offset, var_type, storage_type,
+                                           StorageType.CONTAINER_MEMBER,
+                                           StorageType.ARRAY_CONTAINER))
+
+        elif kind == MULTISUBTYPE_MEMBER:
+            # subdata reference implies recursive call for reading the
+            # binary data
+
+            # the member that determines the subtype of each entry
+            subtype_members = extra
+
+            # arguments passed to the next-level instances.
+            # they are the same for all entries, so the dict is built once.
+            varargs = dict()
+
+            if var_type.passed_args:
+                for passed_member_name in var_type.passed_args:
+                    varargs[passed_member_name] = getattr(
+                        self, passed_member_name)
+
+            # subdata list length has to be defined beforehand as a
+            # object member OR number.  it's name or count is specified
+            # at the subdata member definition by length.
+            list_len = var_type.get_length(self)
+
+            # prepare result storage lists
+            if isinstance(var_type, SubdataMember):
+                # single-subtype child data list
+                target_list = []
+                setattr(self, var_name, target_list)
+                single_type_subdata = True
+            else:
+                # multi-subtype child data list
+                target_dict = {key: [] for key in var_type.class_lookup}
+                setattr(self, var_name, target_dict)
+                single_type_subdata = False
+
+            # List for storing the ValueMember instance of each subdata structure
+            subdata_value_members = []
+            allowed_member_type = StorageType.CONTAINER_MEMBER
+
+            # check if entries need offset checking
+            if var_type.offset_to:
+                offset_lookup = getattr(self, var_type.offset_to[0])
+            else:
+                offset_lookup = None
+
+            for i in range(list_len):
+
+                # List of subtype members filled if there's a subtype to be read
+                sub_members = []
+
+                # if datfile offset == 0, entry has to be skipped.
+                if offset_lookup:
+                    if not var_type.offset_to[1](offset_lookup[i]):
+                        continue
+                    # TODO: don't read sequentially, use the lookup as
+                    #       new offset?
+
+                if single_type_subdata:
+                    # append single data entry to the subdata object list
+                    new_data_class = var_type.class_lookup[None]
+                else:
+                    # to determine the subtype class, read the binary
+                    # definition. this utilizes an on-the-fly definition
+                    # of the data to be read.
+                    offset, sub_members = read_members(
+                        self, raw, offset, game_version, target_class,
+                        subtype_members
+                    )
+
+                    # read the variable set by the above read call to
+                    # use the read data to determine the denominaton of
+                    # the member type
+                    subtype_name = getattr(
+                        self, var_type.subtype_definition[1])
+
+                    # look up the type name to get the subtype class
+                    new_data_class = var_type.class_lookup[subtype_name]
+
+                # create instance of submember class and store the passed
+                # arguments directly, like GenieStructure.__init__() does
+                new_data = new_data_class()
+                if varargs:
+                    new_data.__dict__.update(varargs)
+
+                # recursive call, read the subdata.
+                offset, gen_members = new_data.read(raw, offset, game_version, new_data_class)
+
+                # append the new data to the appropriate list
+                if single_type_subdata:
+                    target_list.append(new_data)
+                else:
+                    target_dict[subtype_name].append(new_data)
+
+                if export is READ_GEN:
+                    # Append the data to the ValueMember list
+                    if storage_type is StorageType.ARRAY_CONTAINER:
+                        # Put the subtype members in front
+                        sub_members.extend(gen_members)
+                        gen_members = sub_members
+                        # create a container for the retrieved members
+                        container = ContainerMember(var_name, gen_members)
+
+                        # Save the container to a list
+                        # The array is created after the for-loop
+                        subdata_value_members.append(container)
+
+                    else:
+                        raise Exception("%s at offset %# 08x: Data read via %s "
+                                        "cannot be stored as %s;"
+                                        " expected %s"
+                                        % (var_name, offset, var_type, storage_type,
+                                           StorageType.ARRAY_CONTAINER))
+
+            if export is READ_GEN:
+                # Create an array from the subdata structures
+                # and append it to the other generated members
+                array = ArrayMember(var_name, allowed_member_type, subdata_value_members)
+                generated_value_members.append(array)
+
+        else:
+            # reading binary data, as this member is no reference but
+            # actual content.
+
+            is_array, struct_type, symbol, data_count, packer = extra
+            is_custom_member = kind == CUSTOM_MEMBER
+
+            if is_custom_member:
+                data_count = var_type.get_length(self)
+
+            elif isinstance(data_count, str):
+                # dynamic length specified by member name
+                data_count = getattr(self, data_count)
+
+            if is_array and storage_type not in ARRAY_STORAGE_TYPES:
+                raise Exception("%s at offset %# 08x: Data read via %s "
+                                "cannot be stored as %s;"
+                                " expected ArrayMember format"
+                                % (var_name, offset, var_type, storage_type))
+
+            if data_count < 0:
+                raise Exception("invalid length %d < 0 in %s for member '%s'" % (
+                    data_count, var_type, var_name))
+
+            if symbol is None:
+                raise Exception("%s: member %s requests unknown data type %s" % (
+                    repr(self), var_name, struct_type))
+
+            if export is READ_UNKNOWN:
+                # for unknown variables, generate uid for the unknown
+                # memory location
+                var_name = "unknown-0x%08x" % offset
+
+            # read that stuff!!11
+            if packer is None:
+                packer = get_packer(data_count, symbol)
+
+            if export is not SKIP:
+                result = packer.unpack_from(raw, offset)
+
+                if is_custom_member:
+                    if not var_type.verify_read_data(self, result):
+                        raise Exception("invalid data when reading %s "
+                                        "at offset %# 08x" % (
+                                            var_name, offset))
+
+                # TODO: move these into a read entry hook/verification method
+                if symbol == "s":
+                    # stringify char array
+                    result = decode_char_array(result[0])
+
+                    if export is READ_GEN:
+                        if storage_type is StorageType.STRING_MEMBER:
+                            gen_member = StringMember(var_name, result)
+
+                        else:
+                            raise Exception("%s at offset %# 08x: Data read via %s "
+                                            "cannot be stored as %s;"
+                                            " expected %s"
+                                            % (var_name, offset, var_type, storage_type,
+                                               StorageType.STRING_MEMBER))
+
+                        generated_value_members.append(gen_member)
+
+                elif is_array:
+                    if export is READ_GEN:
+                        # Turn every element of result into a member
+                        # and put them into an array
+                        array = array_value_member(var_name, offset, var_type,
+                                                   storage_type, result)
+                        generated_value_members.append(array)
+
+                elif data_count == 1:
+                    # store first tuple element
+                    result = result[0]
+
+                    if symbol == "f":
+                        # checked on the c double, without a python call
+                        if not isfinite(<double>result):
+                            raise Exception("invalid float when "
+                                            "reading %s at offset %# 08x" % (
+                                                var_name, offset))
+
+                    if export is READ_GEN:
+                        # Store the member as ValueMember
+                        if is_custom_member:
+                            lookup_result = var_type.entry_hook(result)
+
+                            if isinstance(var_type, EnumLookupMember):
+                                # store differently depending on storage type
+                                if storage_type is StorageType.INT_MEMBER:
+                                    # store as plain integer value
+                                    gen_member = IntMember(var_name, result)
+
+                                elif storage_type is StorageType.ID_MEMBER:
+                                    # store as plain integer value
+                                    gen_member = IDMember(var_name, result)
+
+                                elif storage_type is StorageType.BITFIELD_MEMBER:
+                                    # store as plain integer value
+                                    gen_member = BitfieldMember(var_name, result)
+
+                                elif storage_type is StorageType.STRING_MEMBER:
+                                    # store by looking up value from dict
+                                    gen_member = StringMember(var_name, lookup_result)
+
+                                else:
+                                    raise Exception("%s at offset %# 08x: Data read via %s "
+                                                    "cannot be stored as %s;"
+                                                    " expected %s, %s, %s or %s"
+                                                    % (var_name, offset, var_type, storage_type,
+                                                       StorageType.INT_MEMBER,
+                                                       StorageType.ID_MEMBER,
+                                                       StorageType.BITFIELD_MEMBER,
+                                                       StorageType.STRING_MEMBER))
+
+                            elif isinstance(var_type, ContinueReadMember):
+                                if storage_type is StorageType.BOOLEAN_MEMBER:
+                                    gen_member = StringMember(var_name, lookup_result)
+
+                                else:
+                                    raise Exception("%s at offset %# 08x: Data read via %s "
+                                                    "cannot be stored as %s;"
+                                                    " expected %s"
+                                                    % (var_name, offset, var_type, storage_type,
+                                                       StorageType.BOOLEAN_MEMBER))
+
+                        else:
+                            gen_member = primitive_value_member(var_name, offset, var_type,
+                                                                storage_type, result)
+
+                        generated_value_members.append(gen_member)
+
+                # run entry hook for non-primitive members
+                if is_custom_member:
+                    result = var_type.entry_hook(result)
+
+                    if result == ContinueReadMember.Result.ABORT:
+                        # don't go through all other members of this class!
+                        stop_reading_members = True
+
+                # store member's data value
+                setattr(self, var_name, result)
+
+            # increase the current file position by the size we just read
+            offset += packer.size
+
+    return offset, generated_value_members
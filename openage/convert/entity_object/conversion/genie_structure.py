@@ -2,24 +2,479 @@
 
 # TODO pylint: disable=C,R
 
+from keyword import iskeyword
+import ast
 import hashlib
+import linecache
 import math
 import struct
 
 from openage.convert.value_object.init.game_version import GameEdition
 
-from ....util.strings import decode_until_null
 from ...deprecated.struct_definition import (StructDefinition, vararray_match,
                                              integer_match)
 from ...deprecated.util import struct_type_lookup
 from ...value_object.read.member_access import READ, READ_GEN, READ_UNKNOWN, NOREAD_EXPORT, SKIP
 from ...value_object.read.read_members import (IncludeMembers, ContinueReadMember,
                                                MultisubtypeMember, GroupMember, SubdataMember,
-                                               ReadMember,
-                                               EnumLookupMember)
-from ...value_object.read.value_members import ContainerMember, ArrayMember, IntMember, FloatMember,\
-    StringMember, BooleanMember, IDMember, BitfieldMember
+                                               ReadMember)
+from ...value_object.read.value_members import IntMember, FloatMember, BooleanMember, IDMember
 from ...value_object.read.value_members import MemberTypes as StorageType
+from .genie_read import (ARRAY_STORAGE_TYPES, array_value_member, get_packer,
+                         primitive_value_member, read_members)
+
+
+# kinds of members in the prepared data format, see _member_entry().
+# the member loop in genie_read.pyx uses the same values.
+_GROUP_MEMBER = 0
+_MULTISUBTYPE_MEMBER = 1
+_PRIMITIVE_MEMBER = 2
+_CUSTOM_MEMBER = 3
+_PRIMITIVE_RUN = 4
+_SKIPPED_MEMBER = 5
+
+# storage types of single primitive values and their ValueMember
+_VALUE_MEMBER_TYPES = {
+    StorageType.INT_MEMBER: IntMember,
+    StorageType.FLOAT_MEMBER: FloatMember,
+    StorageType.BOOLEAN_MEMBER: BooleanMember,
+    StorageType.ID_MEMBER: IDMember,
+}
+
+
+def _member_entry(member):
+    """
+    prepare a member of get_data_format() for reading.
+
+    returns (kind, export, var_name, storage_type, var_type, extra).
+    the kind replaces the type checks of the member definition during read.
+
+    for primitive and custom members, extra is
+    (is_array, struct_type, symbol, data_count, packer):
+    the c type and its struct symbol (None if the type is unknown),
+    the number of values as int or the name of the member that stores it,
+    and the struct for reading the member if its layout is constant.
+    the length of custom members is queried during read, so data_count
+    is None for them.
+
+    for multisubtype members, extra holds the prepared member that
+    determines the subtype of each entry (None for SubdataMembers).
+    """
+    _, export, var_name, storage_type, var_type = member
+
+    if isinstance(var_type, GroupMember):
+        if not issubclass(var_type.cls, GenieStructure):
+            raise Exception("class where members should be "
+                            "included is not exportable: %s" % (
+                                var_type.cls.__name__))
+
+        return (_GROUP_MEMBER, export, var_name, storage_type, var_type, None)
+
+    elif isinstance(var_type, MultisubtypeMember):
+        for subtype_class in var_type.class_lookup.values():
+            if not issubclass(subtype_class, GenieStructure):
+                raise Exception("dumped data "
+                                "is not exportable: %s" % (
+                                    subtype_class.__name__))
+
+        if isinstance(var_type, SubdataMember):
+            subtype_members = None
+
+        else:
+            # the member that determines the subtype of each entry
+            subtype_members = (_member_entry((False,) + var_type.subtype_definition),)
+
+        return (_MULTISUBTYPE_MEMBER, export, var_name, storage_type, var_type,
+                subtype_members)
+
+    elif isinstance(var_type, str):
+        kind = _PRIMITIVE_MEMBER
+        array_match = vararray_match.match(var_type)
+
+        if array_match:
+            is_array = True
+            struct_type = array_match.group(1)
+            data_count = array_match.group(2)
+
+            if struct_type == "char":
+                struct_type = "char[]"
+
+            if integer_match.match(data_count):
+                # integer length
+                data_count = int(data_count)
+
+            # otherwise, the length is specified by member name
+
+        else:
+            is_array = False
+            struct_type = var_type
+            data_count = 1
+
+    elif isinstance(var_type, ReadMember):
+        # These could be EnumMember, EnumLookupMember, etc.
+
+        # special type requires having set the raw data type
+        kind = _CUSTOM_MEMBER
+        is_array = False
+        struct_type = var_type.raw_type
+        data_count = None
+
+    else:
+        raise Exception(
+            "unknown data member definition %s for member '%s'" % (var_type, var_name))
+
+    symbol = struct_type_lookup.get(struct_type)
+
+    if symbol is not None and isinstance(data_count, int):
+        packer = get_packer(data_count, symbol)
+
+    else:
+        packer = None
+
+    if (kind == _PRIMITIVE_MEMBER and export == SKIP and symbol is not None and
+            (not is_array or storage_type in ARRAY_STORAGE_TYPES)):
+        # skipped values are never unpacked, only their size is needed
+        kind = _SKIPPED_MEMBER
+
+    return (kind, export, var_name, storage_type, var_type,
+            (is_array, struct_type, symbol, data_count, packer))
+
+
+def _is_fixed_layout(member):
+    """
+    check if a member of the data format can be part of a _PrimitiveRun.
+
+    that's the case for primitive types and arrays with constant length,
+    but not for char arrays that have to be decoded.
+    """
+    kind, export, _, storage_type, _, extra = member
+
+    if kind == _SKIPPED_MEMBER:
+        # skipped char arrays are fine, they're not decoded
+        return extra[4] is not None
+
+    if kind != _PRIMITIVE_MEMBER or export not in (READ, READ_GEN, READ_UNKNOWN):
+        return False
+
+    is_array, _, symbol, _, packer = extra
+
+    if packer is None or symbol == "s":
+        return False
+
+    if is_array and storage_type not in ARRAY_STORAGE_TYPES:
+        # the regular read raises the error for this
+        return False
+
+    return True
+
+
+class _PrimitiveRun:
+    """
+    consecutive members with a fixed binary layout.
+
+    all of them are unpacked with a single struct call
+    instead of one call per member, see _generate_reader().
+    """
+
+    def __init__(self, members):
+        # names of all members in the run, including skipped ones
+        self.member_names = []
+
+        # (export, var_name, storage_type, var_type,
+        #  symbol, data_count, is_array, value_index, relative_offset)
+        self.fields = []
+
+        struct_format = ["<"]
+        value_index = 0
+        relative_offset = 0
+
+        for _, export, var_name, storage_type, var_type, extra in members:
+            is_array, _, symbol, data_count, packer = extra
+            size = packer.size
+
+            self.member_names.append(var_name)
+
+            if export == SKIP:
+                # only advance the position
+                struct_format.append("%dx" % size)
+
+            else:
+                struct_format.append("%d%s" % (data_count, symbol))
+                self.fields.append((export, var_name, storage_type, var_type,
+                                    symbol, data_count, is_array,
+                                    value_index, relative_offset))
+                value_index += data_count
+
+            relative_offset += size
+
+        self.packer = struct.Struct("".join(struct_format))
+
+    def __repr__(self):
+        return "_PrimitiveRun<%s>" % ", ".join(str(name) for name in self.member_names)
+
+
+def _merge_primitive_runs(members):
+    """
+    replace sequences of members with a fixed binary layout
+    in the member list by _PrimitiveRun entries.
+    """
+    result = []
+    run = []
+
+    for member in members:
+        if _is_fixed_layout(member):
+            run.append(member)
+            continue
+
+        if run:
+            result.append((_PRIMITIVE_RUN, None, None, None, _PrimitiveRun(run), None))
+            run = []
+
+        result.append(member)
+
+    if run:
+        result.append((_PRIMITIVE_RUN, None, None, None, _PrimitiveRun(run), None))
+
+    return tuple(result)
+
+
+def _generate_reader(cls, members, game_version):
+    """
+    generate a function that reads the given data format members of cls
+    for game_version.
+
+    the member list is unrolled into straight-line python code:
+    members in a _PrimitiveRun are unpacked and stored with literal
+    indices and offsets, all other members are passed to
+    read_members() of genie_read.pyx.
+
+    the generated function has the signature
+    (self, raw, offset, game_version) -> (offset, generated_value_members).
+    """
+    namespace = {
+        "read": read_members,
+        "cls": cls,
+        "isfinite": math.isfinite,
+        "ABORT": ContinueReadMember.Result.ABORT,
+    }
+
+    def const(value):
+        # make an object accessible to the generated code
+        name = "const%d" % len(namespace)
+        namespace[name] = value
+        return name
+
+    def store(var_name, value_expr, name_expr=None):
+        # assign a value to a member of self
+        if name_expr is None:
+            if var_name.isidentifier() and not iskeyword(var_name):
+                return "self.%s = %s" % (var_name, value_expr)
+
+            name_expr = repr(var_name)
+
+        return "setattr(self, %s, %s)" % (name_expr, value_expr)
+
+    def load(var_name):
+        # access a member of self
+        if var_name.isidentifier() and not iskeyword(var_name):
+            return "self.%s" % var_name
+
+        return "getattr(self, %r)" % var_name
+
+    def unpack(run):
+        # read all members of a _PrimitiveRun
+        lines = []
+
+        if run.fields:
+            lines.append("values = %s(raw, offset)" % const(run.packer.unpack_from))
+
+        for (export, var_name, storage_type, var_type, symbol, data_count,
+             is_array, value_index, relative_offset) in run.fields:
+
+            offset_expr = "offset + %d" % relative_offset
+            name_expr = None
+
+            if export == READ_UNKNOWN:
+                # for unknown variables, generate uid for the unknown
+                # memory location
+                lines.append('name = "unknown-0x%%08x" %% (%s)' % offset_expr)
+                name_expr = "name"
+
+            if is_array:
+                lines.append("value = values[%d:%d]" % (value_index,
+                                                        value_index + data_count))
+
+                if export == READ_GEN:
+                    lines.append("generated_value_members.append(%s(%s, %s, %s, %s, value))" % (
+                        const(array_value_member), name_expr or repr(var_name),
+                        offset_expr, const(var_type), const(storage_type)))
+
+            else:
+                lines.append("value = values[%d]" % value_index)
+
+                if symbol == "f":
+                    lines.extend((
+                        "if not isfinite(value):",
+                        '    raise Exception("invalid float when reading %%s '
+                        'at offset %%# 08x" %% (%s, %s))' % (name_expr or repr(var_name),
+                                                             offset_expr),
+                    ))
+
+                if export == READ_GEN:
+                    if storage_type in _VALUE_MEMBER_TYPES:
+                        lines.append("generated_value_members.append(%s(%s, value))" % (
+                            const(_VALUE_MEMBER_TYPES[storage_type]),
+                            name_expr or repr(var_name)))
+
+                    else:
+                        # raises the error for the invalid storage type
+                        lines.append("%s(%s, %s, %s, %s, value)" % (
+                            const(primitive_value_member), name_expr or repr(var_name),
+                            offset_expr, const(var_type), const(storage_type)))
+
+            lines.append(store(var_name, "value", name_expr))
+
+        lines.append("offset += %d" % run.packer.size)
+
+        return lines
+
+    def abort(remaining_members):
+        # replacement values for the members that are not read anymore.
+        # immutable values are stored with a single update of the instance
+        # dict, mutable ones (the subdata lists) are created per instance.
+        defaults = {}
+        factories = {}
+
+        def replace(var_name, value, factory=None):
+            defaults.pop(var_name, None)
+            factories.pop(var_name, None)
+
+            if factory is None:
+                defaults[var_name] = value
+
+            else:
+                factories[var_name] = factory
+
+        for kind, _, var_name, _, var_type, _ in remaining_members:
+            if kind == _PRIMITIVE_RUN:
+                for member_name in var_type.member_names:
+                    if member_name is not None:
+                        replace(member_name, 0)
+
+            elif var_name is None:
+                # included and unknown members have no name
+                continue
+
+            elif kind not in (_PRIMITIVE_MEMBER, _SKIPPED_MEMBER):
+                empty_value = var_type.get_empty_value()
+
+                if isinstance(empty_value, (int, float, str)):
+                    replace(var_name, empty_value)
+
+                else:
+                    replace(var_name, None, var_type.get_empty_value)
+
+            else:
+                replace(var_name, 0)
+
+        lines = []
+
+        if defaults:
+            lines.append("self.__dict__.update(%s)" % const(defaults))
+
+        lines.extend(store(var_name, "%s()" % const(factory))
+                     for var_name, factory in factories.items())
+
+        lines.append("return offset, generated_value_members")
+
+        return lines
+
+    body = ["generated_value_members = []"]
+
+    for index, member in enumerate(members):
+        kind, export, var_name, _, var_type, _ = member
+
+        if kind == _PRIMITIVE_RUN:
+            body.extend(unpack(var_type))
+            continue
+
+        if kind == _SKIPPED_MEMBER:
+            # skipped member with dynamic length, advance by its size
+            _, _, symbol, data_count, _ = member[5]
+            body.extend((
+                "data_count = %s" % load(data_count),
+                "if data_count < 0:",
+                "    raise Exception(%r %% (data_count, %r, %r))" % (
+                    "invalid length %d < 0 in %s for member '%s'", var_type, var_name),
+                "offset += data_count * %d" % get_packer(1, symbol).size,
+            ))
+            continue
+
+        # the entry hook of a ContinueReadMember may stop reading
+        # the following members of this class
+        can_abort = (kind == _CUSTOM_MEMBER and export != SKIP and
+                     isinstance(var_type, ContinueReadMember))
+
+        if can_abort and export == READ_UNKNOWN:
+            body.append("member_offset = offset")
+
+        body.extend((
+            "offset, gen_members = read(self, raw, offset, game_version, cls, %s)" % (
+                const((member,))),
+            "generated_value_members.extend(gen_members)",
+        ))
+
+        if can_abort:
+            if export == READ_UNKNOWN:
+                body.append('if getattr(self, "unknown-0x%08x" % member_offset) == ABORT:')
+
+            else:
+                body.append("if %s == ABORT:" % load(var_name))
+
+            body.extend("    " + line for line in abort(members[index + 1:]))
+
+    body.append("return offset, generated_value_members")
+
+    func_name = "read_%s" % cls.__name__
+    # the data format differs between game versions, so each of them
+    # needs its own file name in the linecache
+    game_edition, game_expansions = game_version
+    file_name = "<genie reader %s.%s for %s>" % (
+        cls.__module__, cls.__qualname__,
+        "+".join(game.game_id for game in (game_edition, *game_expansions)))
+    source = "def %s(self, raw, offset, game_version):\n%s\n" % (
+        func_name, "\n".join("    " + line for line in body))
+
+    # register the source so that tracebacks can show the generated code
+    linecache.cache[file_name] = (len(source), None, source.splitlines(True), file_name)
+
+    tree = ast.parse(source, file_name)
+
+    # the source is assembled above from the data format definition only,
+    # it never contains data that was read.
+    exec(compile(tree, file_name, "exec"), namespace)  # pylint: disable=exec-used
+
+    return namespace[func_name]
+
+
+class _HashedData:
+    """
+    collects the data that is passed to update() like a hasher would.
+
+    used by GenieStructure.format_hash() to keep the data of a struct,
+    so that it only has to be assembled once.
+    """
+
+    __slots__ = ('parts',)
+
+    def __init__(self):
+        self.parts = []
+
+    def update(self, data):
+        """
+        add data to the collected parts.
+        """
+        self.parts.append(data)
 
 
 class GenieStructure:
@@ -50,6 +505,22 @@ class GenieStructure:
     #            (see read_members.py)
     # ===========================================================
 
+    # the caches below only hold entries for the game version
+    # that was used last, see _use_caches_for().
+    _cached_game_version = None
+
+    # cache for the member lists returned by _cached_format()
+    # (cls, allowed_modes, flatten_includes) -> members
+    _format_cache = {}
+
+    # cache for the readers returned by get_reader()
+    # cls -> reader
+    _reader_cache = {}
+
+    # cache for the data hashed by format_hash()
+    # cls -> data
+    _hash_cache = {}
+
     def __init__(self, **args):
         # store passed arguments as members
         self.__dict__.update(args)
@@ -59,489 +530,76 @@ class GenieStructure:
         recursively read defined binary data from raw at given offset.
 
         this is used to fill the python classes with data from the binary input.
+
+        raw can be any object supporting the buffer protocol, e.g. bytes or
+        a memoryview of a mmap.
+
+        members can restrict the read to the given members of the data format,
+        prepared by _member_entry().
         """
         if cls:
             target_class = cls
         else:
             target_class = self
 
-        # Members are returned at the end
-        generated_value_members = []
-
-        # break out of the current reading loop when members don't exist in
-        # source data file
-        stop_reading_members = False
-
         if not members:
-            members = target_class.get_data_format(game_version,
-                                                   allowed_modes=(True,
-                                                                  READ,
-                                                                  READ_GEN,
-                                                                  READ_UNKNOWN,
-                                                                  SKIP),
-                                                   flatten_includes=False)
-
-        for _, export, var_name, storage_type, var_type in members:
-
-            if stop_reading_members:
-                if isinstance(var_type, ReadMember):
-                    replacement_value = var_type.get_empty_value()
-                else:
-                    replacement_value = 0
+            # read all members of the class with its generated reader
+            reader = target_class.get_reader(game_version)
 
-                setattr(self, var_name, replacement_value)
-                continue
-
-            if isinstance(var_type, GroupMember):
-                if not issubclass(var_type.cls, GenieStructure):
-                    raise Exception("class where members should be "
-                                    "included is not exportable: %s" % (
-                                        var_type.cls.__name__))
-
-                if isinstance(var_type, IncludeMembers):
-                    # call the read function of the referenced class (cls),
-                    # but store the data to the current object (self).
-                    offset, gen_members = var_type.cls.read(self, raw, offset,
-                                                            game_version,
-                                                            cls=var_type.cls)
-
-                    if export == READ_GEN:
-                        # Push the passed members directly into the list of generated members
-                        generated_value_members.extend(gen_members)
-
-                else:
-                    # create new instance of ValueMember,
-                    # depending on the storage type.
-                    # then save the result as a reference named `var_name`
-                    grouped_data = var_type.cls()
-                    offset, gen_members = grouped_data.read(raw, offset, game_version)
-
-                    setattr(self, var_name, grouped_data)
-
-                    if export == READ_GEN:
-                        # Store the data
-                        if storage_type is StorageType.CONTAINER_MEMBER:
-                            # push the members into a ContainerMember
-                            container = ContainerMember(var_name, gen_members)
-
-                            generated_value_members.append(container)
-
-                        elif storage_type is StorageType.ARRAY_CONTAINER:
-                            # create a container for the members first, then push the
-                            # container into an array
-                            container = ContainerMember(var_name, gen_members)
-                            allowed_member_type = StorageType.CONTAINER_MEMBER
-                            array = ArrayMember(var_name, allowed_member_type, [container])
-
-                            generated_value_members.append(array)
-
-                        else:
-                            raise Exception("%s at offset %# 08x: Data read via %s "
-                                            "cannot be stored as %s;"
-                                            " expected %s or %s"
-                                            % (var_name, offset, var_type, storage_type,
-                                               StorageType.CONTAINER_MEMBER,
-                                               StorageType.ARRAY_CONTAINER))
-
-            elif isinstance(var_type, MultisubtypeMember):
-                # subdata reference implies recursive call for reading the
-                # binary data
-
-                # arguments passed to the next-level constructor.
-                varargs = dict()
-
-                if var_type.passed_args:
-                    if isinstance(var_type.passed_args, str):
-                        var_type.passed_args = set(var_type.passed_args)
-                    for passed_member_name in var_type.passed_args:
-                        varargs[passed_member_name] = getattr(
-                            self, passed_member_name)
-
-                # subdata list length has to be defined beforehand as a
-                # object member OR number.  it's name or count is specified
-                # at the subdata member definition by length.
-                list_len = var_type.get_length(self)
-
-                # prepare result storage lists
-                if isinstance(var_type, SubdataMember):
-                    # single-subtype child data list
-                    setattr(self, var_name, list())
-                    single_type_subdata = True
-                else:
-                    # multi-subtype child data list
-                    setattr(self, var_name, {key: []
-                                             for key in var_type.class_lookup})
-                    single_type_subdata = False
-
-                # List for storing the ValueMember instance of each subdata structure
-                subdata_value_members = []
-                allowed_member_type = StorageType.CONTAINER_MEMBER
-
-                # check if entries need offset checking
-                if var_type.offset_to:
-                    offset_lookup = getattr(self, var_type.offset_to[0])
-                else:
-                    offset_lookup = None
-
-                for i in range(list_len):
-
-                    # List of subtype members filled if there's a subtype to be read
-                    sub_members = []
-
-                    # if datfile offset == 0, entry has to be skipped.
-                    if offset_lookup:
-                        if not var_type.offset_to[1](offset_lookup[i]):
-                            continue
-                        # TODO: don't read sequentially, use the lookup as
-                        #       new offset?
-
-                    if single_type_subdata:
-                        # append single data entry to the subdata object list
-                        new_data_class = var_type.class_lookup[None]
-                    else:
-                        # to determine the subtype class, read the binary
-                        # definition. this utilizes an on-the-fly definition
-                        # of the data to be read.
-                        offset, sub_members = self.read(
-                            raw, offset, game_version, cls=target_class,
-                            members=(((False,) + var_type.subtype_definition),)
-                        )
-
-                        # read the variable set by the above read call to
-                        # use the read data to determine the denominaton of
-                        # the member type
-                        subtype_name = getattr(
-                            self, var_type.subtype_definition[1])
-
-                        # look up the type name to get the subtype class
-                        new_data_class = var_type.class_lookup[subtype_name]
-
-                    if not issubclass(new_data_class, GenieStructure):
-                        raise Exception("dumped data "
-                                        "is not exportable: %s" % (
-                                            new_data_class.__name__))
-
-                    # create instance of submember class
-                    new_data = new_data_class(**varargs)
-
-                    # recursive call, read the subdata.
-                    offset, gen_members = new_data.read(raw, offset, game_version, new_data_class)
-
-                    # append the new data to the appropriate list
-                    if single_type_subdata:
-                        getattr(self, var_name).append(new_data)
-                    else:
-                        getattr(self, var_name)[subtype_name].append(new_data)
-
-                    if export == READ_GEN:
-                        # Append the data to the ValueMember list
-                        if storage_type is StorageType.ARRAY_CONTAINER:
-                            # Put the subtype members in front
-                            sub_members.extend(gen_members)
-                            gen_members = sub_members
-                            # create a container for the retrieved members
-                            container = ContainerMember(var_name, gen_members)
-
-                            # Save the container to a list
-                            # The array is created after the for-loop
-                            subdata_value_members.append(container)
-
-                        else:
-                            raise Exception("%s at offset %# 08x: Data read via %s "
-                                            "cannot be stored as %s;"
-                                            " expected %s"
-                                            % (var_name, offset, var_type, storage_type,
-                                               StorageType.ARRAY_CONTAINER))
-
-                if export == READ_GEN:
-                    # Create an array from the subdata structures
-                    # and append it to the other generated members
-                    array = ArrayMember(var_name, allowed_member_type, subdata_value_members)
-                    generated_value_members.append(array)
-
-            else:
-                # reading binary data, as this member is no reference but
-                # actual content.
-
-                data_count = 1
-                is_array = False
-                is_custom_member = False
-
-                if isinstance(var_type, str):
-                    is_array = vararray_match.match(var_type)
-
-                    if is_array:
-                        struct_type = is_array.group(1)
-                        data_count = is_array.group(2)
-                        if struct_type == "char":
-                            struct_type = "char[]"
-
-                        if integer_match.match(data_count):
-                            # integer length
-                            data_count = int(data_count)
-                        else:
-                            # dynamic length specified by member name
-                            data_count = getattr(self, data_count)
-
-                        if storage_type not in (StorageType.STRING_MEMBER,
-                                                StorageType.ARRAY_INT,
-                                                StorageType.ARRAY_FLOAT,
-                                                StorageType.ARRAY_BOOL,
-                                                StorageType.ARRAY_ID,
-                                                StorageType.ARRAY_STRING):
-                            raise Exception("%s at offset %# 08x: Data read via %s "
-                                            "cannot be stored as %s;"
-                                            " expected ArrayMember format"
-                                            % (var_name, offset, var_type, storage_type))
-
-                    else:
-                        struct_type = var_type
-                        data_count = 1
+            return reader(self, raw, offset, game_version)
 
-                elif isinstance(var_type, ReadMember):
-                    # These could be EnumMember, EnumLookupMember, etc.
-
-                    # special type requires having set the raw data type
-                    struct_type = var_type.raw_type
-                    data_count = var_type.get_length(self)
-                    is_custom_member = True
-
-                else:
-                    raise Exception(
-                        "unknown data member definition %s for member '%s'" % (var_type, var_name))
-
-                if data_count < 0:
-                    raise Exception("invalid length %d < 0 in %s for member '%s'" % (
-                        data_count, var_type, var_name))
-
-                if struct_type not in struct_type_lookup:
-                    raise Exception("%s: member %s requests unknown data type %s" % (
-                        repr(self), var_name, struct_type))
-
-                if export == READ_UNKNOWN:
-                    # for unknown variables, generate uid for the unknown
-                    # memory location
-                    var_name = "unknown-0x%08x" % offset
-
-                # lookup c type to python struct scan type
-                symbol = struct_type_lookup[struct_type]
-
-                # read that stuff!!11
-                struct_format = "< %d%s" % (data_count, symbol)
-
-                if export != SKIP:
-                    result = struct.unpack_from(struct_format, raw, offset)
-
-                    if is_custom_member:
-                        if not var_type.verify_read_data(self, result):
-                            raise Exception("invalid data when reading %s "
-                                            "at offset %# 08x" % (
-                                                var_name, offset))
-
-                    # TODO: move these into a read entry hook/verification method
-                    if symbol == "s":
-                        # stringify char array
-                        result = decode_until_null(result[0])
-
-                        if export == READ_GEN:
-                            if storage_type is StorageType.STRING_MEMBER:
-                                gen_member = StringMember(var_name, result)
-
-                            else:
-                                raise Exception("%s at offset %# 08x: Data read via %s "
-                                                "cannot be stored as %s;"
-                                                " expected %s"
-                                                % (var_name, offset, var_type, storage_type,
-                                                   StorageType.STRING_MEMBER))
-
-                            generated_value_members.append(gen_member)
-
-                    elif is_array:
-                        if export == READ_GEN:
-                            # Turn every element of result into a member
-                            # and put them into an array
-                            array_members = []
-                            allowed_member_type = None
-
-                            for elem in result:
-                                if storage_type is StorageType.ARRAY_INT:
-                                    gen_member = IntMember(var_name, elem)
-                                    allowed_member_type = StorageType.INT_MEMBER
-                                    array_members.append(gen_member)
-
-                                elif storage_type is StorageType.ARRAY_FLOAT:
-                                    gen_member = FloatMember(var_name, elem)
-                                    allowed_member_type = StorageType.FLOAT_MEMBER
-                                    array_members.append(gen_member)
-
-                                elif storage_type is StorageType.ARRAY_BOOL:
-                                    gen_member = BooleanMember(var_name, elem)
-                                    allowed_member_type = StorageType.BOOLEAN_MEMBER
-                                    array_members.append(gen_member)
-
-                                elif storage_type is StorageType.ARRAY_ID:
-                                    gen_member = IDMember(var_name, elem)
-                                    allowed_member_type = StorageType.ID_MEMBER
-                                    array_members.append(gen_member)
-
-                                elif storage_type is StorageType.ARRAY_STRING:
-                                    gen_member = StringMember(var_name, elem)
-                                    allowed_member_type = StorageType.STRING_MEMBER
-                                    array_members.append(gen_member)
-
-                                else:
-                                    raise Exception("%s at offset %# 08x: Data read via %s "
-                                                    "cannot be stored as %s;"
-                                                    " expected %s, %s, %s, %s or %s"
-                                                    % (var_name, offset, var_type, storage_type,
-                                                       StorageType.ARRAY_INT,
-                                                       StorageType.ARRAY_FLOAT,
-                                                       StorageType.ARRAY_BOOL,
-                                                       StorageType.ARRAY_ID,
-                                                       StorageType.ARRAY_STRING))
-
-                            # Create the array
-                            array = ArrayMember(var_name, allowed_member_type, array_members)
-                            generated_value_members.append(array)
-
-                    elif data_count == 1:
-                        # store first tuple element
-                        result = result[0]
-
-                        if symbol == "f":
-                            if not math.isfinite(result):
-                                raise Exception("invalid float when "
-                                                "reading %s at offset %# 08x" % (
-                                                    var_name, offset))
-
-                        if export == READ_GEN:
-                            # Store the member as ValueMember
-                            if is_custom_member:
-                                lookup_result = var_type.entry_hook(result)
-
-                                if isinstance(var_type, EnumLookupMember):
-                                    # store differently depending on storage type
-                                    if storage_type is StorageType.INT_MEMBER:
-                                        # store as plain integer value
-                                        gen_member = IntMember(var_name, result)
-
-                                    elif storage_type is StorageType.ID_MEMBER:
-                                        # store as plain integer value
-                                        gen_member = IDMember(var_name, result)
-
-                                    elif storage_type is StorageType.BITFIELD_MEMBER:
-                                        # store as plain integer value
-                                        gen_member = BitfieldMember(var_name, result)
-
-                                    elif storage_type is StorageType.STRING_MEMBER:
-                                        # store by looking up value from dict
-                                        gen_member = StringMember(var_name, lookup_result)
-
-                                    else:
-                                        raise Exception("%s at offset %# 08x: Data read via %s "
-                                                        "cannot be stored as %s;"
-                                                        " expected %s, %s, %s or %s"
-                                                        % (var_name, offset, var_type, storage_type,
-                                                           StorageType.INT_MEMBER,
-                                                           StorageType.ID_MEMBER,
-                                                           StorageType.BITFIELD_MEMBER,
-                                                           StorageType.STRING_MEMBER))
-
-                                elif isinstance(var_type, ContinueReadMember):
-                                    if storage_type is StorageType.BOOLEAN_MEMBER:
-                                        gen_member = StringMember(var_name, lookup_result)
-
-                                    else:
-                                        raise Exception("%s at offset %# 08x: Data read via %s "
-                                                        "cannot be stored as %s;"
-                                                        " expected %s"
-                                                        % (var_name, offset, var_type, storage_type,
-                                                           StorageType.BOOLEAN_MEMBER))
-
-                            else:
-                                if storage_type is StorageType.INT_MEMBER:
-                                    gen_member = IntMember(var_name, result)
-
-                                elif storage_type is StorageType.FLOAT_MEMBER:
-                                    gen_member = FloatMember(var_name, result)
-
-                                elif storage_type is StorageType.BOOLEAN_MEMBER:
-                                    gen_member = BooleanMember(var_name, result)
-
-                                elif storage_type is StorageType.ID_MEMBER:
-                                    gen_member = IDMember(var_name, result)
-
-                                else:
-                                    raise Exception("%s at offset %# 08x: Data read via %s "
-                                                    "cannot be stored as %s;"
-                                                    " expected %s, %s, %s or %s"
-                                                    % (var_name, offset, var_type, storage_type,
-                                                       StorageType.INT_MEMBER,
-                                                       StorageType.FLOAT_MEMBER,
-                                                       StorageType.BOOLEAN_MEMBER,
-                                                       StorageType.ID_MEMBER))
-
-                            generated_value_members.append(gen_member)
-
-                    # run entry hook for non-primitive members
-                    if is_custom_member:
-                        result = var_type.entry_hook(result)
-
-                        if result == ContinueReadMember.Result.ABORT:
-                            # don't go through all other members of this class!
-                            stop_reading_members = True
-
-                    # store member's data value
-                    setattr(self, var_name, result)
-
-                # increase the current file position by the size we just read
-                offset += struct.calcsize(struct_format)
-
-        return offset, generated_value_members
+        return read_members(self, raw, offset, game_version, target_class, members)
 
     @classmethod
     def structs(cls):
         """
         create struct definitions for this class and its subdata references.
 
+        every referenced class is only added once, even if it is
+        referenced by multiple structs.
+
         TODO: Remove from buildsystem
         """
 
         ret = list()
-        self_member_count = 0
+        visited = set()
 
         # dummy game edition that represents AoC
-        dummy = GameEdition("", "AoC", "yes", [], [], [], [])
-
-        # acquire all struct members, including the included members
-        members = cls.get_data_format((dummy, []),
-                                      allowed_modes=(True, SKIP, READ_GEN, NOREAD_EXPORT),
-                                      flatten_includes=False)
-
-        for _, _, _, _, member_type in members:
-            self_member_count += 1
-            if isinstance(member_type, MultisubtypeMember):
-                for _, subtype_class in sorted(member_type.class_lookup.items()):
-                    if not issubclass(subtype_class, GenieStructure):
+        game_version = (GameEdition("", "AoC", "yes", [], [], [], []), [])
+
+        def collect(struct_cls):
+            # add the referenced classes first, then struct_cls itself
+            visited.add(struct_cls)
+
+            # acquire all struct members, including the included members
+            members = struct_cls.get_data_format(game_version,
+                                                 allowed_modes=(True, SKIP, READ_GEN,
+                                                                NOREAD_EXPORT),
+                                                 flatten_includes=False)
+
+            for _, _, _, _, member_type in members:
+                if isinstance(member_type, MultisubtypeMember):
+                    for _, subtype_class in sorted(member_type.class_lookup.items()):
+                        if not issubclass(subtype_class, GenieStructure):
+                            raise Exception("tried to export structs "
+                                            "from non-exportable %s" % (
+                                                subtype_class))
+
+                        if subtype_class not in visited:
+                            collect(subtype_class)
+
+                elif isinstance(member_type, GroupMember):
+                    if not issubclass(member_type.cls, GenieStructure):
                         raise Exception("tried to export structs "
-                                        "from non-exportable %s" % (
-                                            subtype_class))
-                    ret += subtype_class.structs()
+                                        "from non-exportable member "
+                                        "included class %r" % (member_type.cls))
 
-            elif isinstance(member_type, GroupMember):
-                if not issubclass(member_type.cls, GenieStructure):
-                    raise Exception("tried to export structs "
-                                    "from non-exportable member "
-                                    "included class %r" % (member_type.cls))
-                ret += member_type.cls.structs()
+                    if member_type.cls not in visited:
+                        collect(member_type.cls)
 
-            else:
-                continue
+            ret.append(StructDefinition(struct_cls))
 
-        # create struct only when it has members?
-        if True or self_member_count > 0:
-            new_def = StructDefinition(cls)
-            ret.append(new_def)
+        collect(cls)
 
         return ret
 
@@ -552,37 +610,66 @@ class GenieStructure:
 
         used for determining changes in the exported data, which requires
         data reconversion.
+
+        if a hasher is given, the members of this structure are added to it.
         """
 
         if not hasher:
             hasher = hashlib.sha512()
 
-        # struct properties
-        hasher.update(cls.name_struct.encode())
-        hasher.update(cls.name_struct_file.encode())
-        hasher.update(cls.struct_description.encode())
-
-        # only hash exported struct members!
-        # non-exported values don't influence anything.
-        members = cls.get_data_format(game_version,
-                                      allowed_modes=(True, SKIP, READ_GEN, NOREAD_EXPORT),
-                                      flatten_includes=False,
-                                      )
-        for _, export, member_name, _, member_type in members:
-            # includemembers etc have no name.
-            if member_name:
-                hasher.update(member_name.encode())
+        if game_version is not GenieStructure._cached_game_version:
+            GenieStructure._use_caches_for(game_version)
+
+        data = GenieStructure._hash_cache.get(cls)
+
+        if data is None:
+            # the hashed data only depends on the game version,
+            # so it is collected once and then reused for every hash.
+            hashed_data = _HashedData()
+
+            # struct properties, not all structs have them
+            for struct_property in (cls.name_struct,
+                                    cls.name_struct_file,
+                                    cls.struct_description):
+                if struct_property is not None:
+                    hashed_data.update(struct_property.encode())
+
+            # only hash exported struct members!
+            # non-exported values don't influence anything.
+            members = cls.get_data_format(game_version,
+                                          allowed_modes=(True, SKIP, READ_GEN, NOREAD_EXPORT),
+                                          flatten_includes=False,
+                                          )
+            for _, export, member_name, _, member_type in members:
+                # includemembers etc have no name.
+                if member_name:
+                    hashed_data.update(member_name.encode())
+
+                if isinstance(member_type, ReadMember):
+                    hashed_data = member_type.format_hash(hashed_data)
+
+                    # the referenced structs depend on the game version,
+                    # so they are hashed here instead of by the member
+                    if isinstance(member_type, MultisubtypeMember):
+                        for _, subtype_class in sorted(member_type.class_lookup.items()):
+                            hashed_data = subtype_class.format_hash(game_version, hashed_data)
+
+                    elif isinstance(member_type, GroupMember):
+                        hashed_data = member_type.cls.format_hash(game_version, hashed_data)
+
+                elif isinstance(member_type, str):
+                    hashed_data.update(member_type.encode())
 
-            if isinstance(member_type, ReadMember):
-                hasher = member_type.format_hash(hasher)
+                else:
+                    raise Exception("can't hash unsupported member")
 
-            elif isinstance(member_type, str):
-                hasher.update(member_type.encode())
+                hashed_data.update(export.name.encode())
 
-            else:
-                raise Exception("can't hash unsupported member")
+            data = b"".join(hashed_data.parts)
+            GenieStructure._hash_cache[cls] = data
 
-            hasher.update(export.name.encode())
+        # the data is passed to the hasher in one go
+        hasher.update(data)
 
         return hasher
 
@@ -628,6 +715,79 @@ class GenieStructure:
             member_entry = (is_parent,) + member
             yield member_entry
 
+    @classmethod
+    def _cached_format(cls, game_version, allowed_modes=False,
+                       flatten_includes=False):
+        """
+        return the members of get_data_format() prepared for reading.
+
+        the data format only depends on the game version, so it is
+        generated once and then reused for every read of this class.
+        the members are prepared by _member_entry() and consecutive
+        members with a fixed binary layout are merged into a
+        _PrimitiveRun entry.
+        """
+        if game_version is not GenieStructure._cached_game_version:
+            GenieStructure._use_caches_for(game_version)
+
+        key = (cls, allowed_modes, flatten_includes)
+        members = GenieStructure._format_cache.get(key)
+
+        if members is None:
+            members = _merge_primitive_runs(
+                _member_entry(member)
+                for member in cls.get_data_format(game_version,
+                                                  allowed_modes,
+                                                  flatten_includes)
+            )
+            GenieStructure._format_cache[key] = members
+
+        return members
+
+    @classmethod
+    def get_reader(cls, game_version):
+        """
+        return the function that reads all members of this class
+        for the given game version.
+
+        the function is generated from the data format on first use,
+        see _generate_reader().
+        """
+        if game_version is not GenieStructure._cached_game_version:
+            GenieStructure._use_caches_for(game_version)
+
+        reader = GenieStructure._reader_cache.get(cls)
+
+        if reader is None:
+            members = cls._cached_format(game_version,
+                                         allowed_modes=(True,
+                                                        READ,
+                                                        READ_GEN,
+                                                        READ_UNKNOWN,
+                                                        SKIP),
+                                         flatten_includes=False)
+
+            reader = _generate_reader(cls, members, game_version)
+            GenieStructure._reader_cache[cls] = reader
+
+        return reader
+
+    @staticmethod
+    def _use_caches_for(game_version):
+        """
+        drop all cached data formats, readers and hashes and fill
+        the caches for game_version from now on.
+
+        the caches are filled per game version, so switching between
+        versions rebuilds them. only the last game version is kept
+        alive by the caches, and they can't grow past the number of
+        GenieStructure classes.
+        """
+        GenieStructure._format_cache.clear()
+        GenieStructure._reader_cache.clear()
+        GenieStructure._hash_cache.clear()
+        GenieStructure._cached_game_version = game_version
+
     @classmethod
     def get_data_format_members(cls, game_version):
         """
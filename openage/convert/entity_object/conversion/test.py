@@ -0,0 +1,359 @@
+# Copyright 2020-2020 the openage authors. See copying.md for legal info.
+
+"""
+Tests for reading binary data with GenieStructure.
+"""
+
+# the members of the test structures are set by GenieStructure.read()
+# pylint: disable=no-member
+
+import struct
+
+from openage.testing.testing import assert_value
+
+from ...value_object.init.game_version import GameEdition
+from ...value_object.read.member_access import READ, READ_GEN, READ_UNKNOWN, SKIP
+from ...value_object.read.read_members import (IncludeMembers, GroupMember, SubdataMember,
+                                               MultisubtypeMember, EnumLookupMember,
+                                               ContinueReadMember)
+from ...value_object.read.value_members import ContainerMember, ArrayMember
+from ...value_object.read.value_members import MemberTypes as StorageType
+from .genie_structure import GenieStructure
+
+
+class Header(GenieStructure):
+    """
+    included by Container.
+    """
+
+    name_struct_file = "test"
+    name_struct = "header"
+    struct_description = "members included by the container."
+
+    @classmethod
+    def get_data_format_members(cls, game_version):
+        """
+        Return the members in this struct.
+        """
+        return [
+            (READ_GEN, "version", StorageType.INT_MEMBER, "int16_t"),
+            (READ, "flags", StorageType.INT_MEMBER, "uint8_t"),
+        ]
+
+
+class Point(GenieStructure):
+    """
+    referenced by GroupMembers and SubdataMembers.
+    """
+
+    name_struct_file = "test"
+    name_struct = "point"
+    struct_description = "a pair of coordinates."
+
+    @classmethod
+    def get_data_format_members(cls, game_version):
+        """
+        Return the members in this struct.
+        """
+        return [
+            (READ_GEN, "x", StorageType.FLOAT_MEMBER, "float"),
+            (READ_GEN, "y", StorageType.FLOAT_MEMBER, "float"),
+        ]
+
+
+class Item(GenieStructure):
+    """
+    subdata of Container whose entries are found with an offset list.
+    """
+
+    name_struct_file = "test"
+    name_struct = "item"
+    struct_description = "an entry of the item list."
+
+    @classmethod
+    def get_data_format_members(cls, game_version):
+        """
+        Return the members in this struct.
+        """
+        return [
+            (READ_GEN, "item_id", StorageType.ID_MEMBER, "int16_t"),
+            (READ_GEN, "count", StorageType.INT_MEMBER, "uint8_t"),
+        ]
+
+
+class SmallEntry(GenieStructure):
+    """
+    subtype of the Container entries, its length is passed by the container.
+    """
+
+    name_struct_file = "test"
+    name_struct = "small_entry"
+    struct_description = "entry with 8 bit values."
+
+    @classmethod
+    def get_data_format_members(cls, game_version):
+        """
+        Return the members in this struct.
+        """
+        return [
+            (READ_GEN, "values", StorageType.ARRAY_INT, "int8_t[value_count]"),
+        ]
+
+
+class LargeEntry(GenieStructure):
+    """
+    subtype of the Container entries, its length is passed by the container.
+    """
+
+    name_struct_file = "test"
+    name_struct = "large_entry"
+    struct_description = "entry with 16 bit values."
+
+    @classmethod
+    def get_data_format_members(cls, game_version):
+        """
+        Return the members in this struct.
+        """
+        return [
+            (READ_GEN, "values", StorageType.ARRAY_INT, "int16_t[value_count]"),
+            (READ_GEN, "weight", StorageType.FLOAT_MEMBER, "float"),
+        ]
+
+
+class Container(GenieStructure):
+    """
+    uses every kind of member except ContinueReadMember.
+    """
+
+    name_struct_file = "test"
+    name_struct = "container"
+    struct_description = "structure with references to other structures."
+
+    @classmethod
+    def get_data_format_members(cls, game_version):
+        """
+        Return the members in this struct.
+        """
+        return [
+            (READ_GEN, None, None, IncludeMembers(cls=Header)),
+            (READ_GEN, "position", StorageType.CONTAINER_MEMBER, GroupMember(Point)),
+            (READ, "item_count", StorageType.INT_MEMBER, "uint8_t"),
+            (READ, "item_offsets", StorageType.ARRAY_INT, "int32_t[item_count]"),
+            (READ_GEN, "items", StorageType.ARRAY_CONTAINER, SubdataMember(
+                ref_type=Item,
+                length="item_count",
+                offset_to=("item_offsets", lambda o: o > 0),
+            )),
+            (READ, "value_count", StorageType.INT_MEMBER, "uint8_t"),
+            (READ, "entry_count", StorageType.INT_MEMBER, "uint8_t"),
+            (READ_GEN, "entries", StorageType.ARRAY_CONTAINER, MultisubtypeMember(
+                type_name="entry_types",
+                subtype_definition=(READ_GEN, "entry_type", StorageType.ID_MEMBER,
+                                    EnumLookupMember(
+                                        type_name="entry_type",
+                                        lookup_dict={1: "small", 2: "large"},
+                                        raw_type="int8_t",
+                                    )),
+                class_lookup={"small": SmallEntry, "large": LargeEntry},
+                length="entry_count",
+                passed_args={"value_count"},
+            )),
+            (READ_UNKNOWN, None, StorageType.INT_MEMBER, "int16_t"),
+            (SKIP, "padding", StorageType.ARRAY_INT, "int8_t[3]"),
+            (SKIP, "reserved", StorageType.ARRAY_INT, "int16_t[value_count]"),
+            (READ_GEN, "name", StorageType.STRING_MEMBER, "char[8]"),
+        ]
+
+
+class OptionalData(GenieStructure):
+    """
+    stops reading its members when has_data is 0.
+    """
+
+    name_struct_file = "test"
+    name_struct = "optional_data"
+    struct_description = "structure with members that may be absent."
+
+    @classmethod
+    def get_data_format_members(cls, game_version):
+        """
+        Return the members in this struct.
+        """
+        return [
+            (READ_GEN, "point_count", StorageType.INT_MEMBER, "int8_t"),
+            (READ_GEN, "has_data", StorageType.BOOLEAN_MEMBER, ContinueReadMember("uint8_t")),
+            (READ_GEN, "amount", StorageType.INT_MEMBER, "int32_t"),
+            (READ_GEN, "points", StorageType.ARRAY_CONTAINER, SubdataMember(
+                ref_type=Point,
+                length="point_count",
+            )),
+        ]
+
+
+def member_values(value_members):
+    """
+    Returns (name, value) for each of the generated value members,
+    with the values of containers and arrays resolved recursively.
+    """
+    return [(member.get_name(), member_value(member)) for member in value_members]
+
+
+def member_value(member):
+    """
+    Returns the plain value of a generated value member.
+    """
+    if isinstance(member, ContainerMember):
+        return {name: member_value(submember)
+                for name, submember in member.get_value().items()}
+
+    if isinstance(member, ArrayMember):
+        return [member_value(submember) for submember in member.get_value()]
+
+    return member.get_value()
+
+
+def test_container(game_version):
+    """
+    Read includes, groups, subdata, multisubtype members, unknown and skipped
+    members.
+    """
+
+    # the data starts at offset 2 and is followed by one byte
+    # that is not part of the container.
+    data = [b"\xaa\xbb"]
+
+    # header include: version, flags
+    data.append(struct.pack("<hB", 3, 5))
+
+    # position group: x, y
+    data.append(struct.pack("<ff", 1.5, -2.0))
+
+    # items: the second entry has offset 0, so it is not in the data
+    data.append(struct.pack("<B3i", 3, 10, 0, 20))
+    data.append(struct.pack("<hB", 7, 1))
+    data.append(struct.pack("<hB", 9, 4))
+
+    # value_count, entry_count and the entries: small, large
+    data.append(struct.pack("<BB", 2, 2))
+    data.append(struct.pack("<b2b", 1, 1, -1))
+    data.append(struct.pack("<b2hf", 2, 300, -300, 0.25))
+
+    unknown_offset = len(b"".join(data))
+
+    # unknown member, 3 padding bytes and value_count reserved int16_t
+    data.append(struct.pack("<h", 0x1234))
+    data.append(b"\xff" * 3)
+    data.append(b"\xee" * 4)
+
+    # name
+    data.append(b"abc\x00\x00\x00\x00\x00")
+
+    data = b"".join(data) + b"\x99"
+
+    # memoryviews are read like bytes,
+    # the second read uses the cached reader.
+    for raw in (data, memoryview(data)):
+        container = Container()
+        offset, value_members = container.read(raw, 2, game_version)
+
+        assert_value(offset, len(data) - 1)
+
+        assert_value(container.version, 3)
+        assert_value(container.flags, 5)
+
+        assert_value(isinstance(container.position, Point), True)
+        assert_value((container.position.x, container.position.y), (1.5, -2.0))
+
+        assert_value(container.item_offsets, (10, 0, 20))
+        assert_value([(item.item_id, item.count) for item in container.items],
+                     [(7, 1), (9, 4)])
+
+        assert_value(container.value_count, 2)
+        assert_value(container.entry_type, "large")
+        assert_value(len(container.entries["small"]), 1)
+        assert_value(len(container.entries["large"]), 1)
+
+        small_entry = container.entries["small"][0]
+        assert_value(small_entry.value_count, 2)
+        assert_value(small_entry.values, (1, -1))
+
+        large_entry = container.entries["large"][0]
+        assert_value(large_entry.value_count, 2)
+        assert_value(large_entry.values, (300, -300))
+        assert_value(large_entry.weight, 0.25)
+
+        assert_value(getattr(container, "unknown-0x%08x" % unknown_offset), 0x1234)
+        assert_value(container.name, "abc")
+
+        assert_value(member_values(value_members), [
+            ("version", 3),
+            ("position", {"x": 1.5, "y": -2.0}),
+            ("items", [
+                {"item_id": 7, "count": 1},
+                {"item_id": 9, "count": 4},
+            ]),
+            ("entries", [
+                {"entry_type": 1, "values": [1, -1]},
+                {"entry_type": 2, "values": [300, -300], "weight": 0.25},
+            ]),
+            ("name", "abc"),
+        ])
+
+
+def test_continue_read(game_version):
+    """
+    Read a structure whose ContinueReadMember aborts reading.
+    """
+
+    # all members are present
+    data = struct.pack("<bBiff", 1, 1, 42, 0.5, 4.0)
+
+    optional_data = OptionalData()
+    offset, value_members = optional_data.read(data, 0, game_version)
+
+    assert_value(offset, len(data))
+    assert_value(optional_data.has_data, ContinueReadMember.Result.CONTINUE)
+    assert_value(optional_data.amount, 42)
+    assert_value([(point.x, point.y) for point in optional_data.points], [(0.5, 4.0)])
+
+    assert_value(member_values(value_members), [
+        ("point_count", 1),
+        ("has_data", "data_exists"),
+        ("amount", 42),
+        ("points", [{"x": 0.5, "y": 4.0}]),
+    ])
+
+    # the members after has_data are absent, the next structure follows
+    data = struct.pack("<bBb", 2, 0, 7)
+
+    first = OptionalData()
+    offset, value_members = first.read(data, 0, game_version)
+
+    assert_value(offset, 2)
+    assert_value(first.has_data, ContinueReadMember.Result.ABORT)
+    assert_value(first.amount, 0)
+    assert_value(first.points, [])
+
+    assert_value(member_values(value_members), [
+        ("point_count", 2),
+        ("has_data", "data_absent"),
+    ])
+
+    # the replacement lists are not shared between instances
+    second = OptionalData()
+    second.read(data, 0, game_version)
+    first.points.append(Point())
+
+    assert_value(second.points, [])
+
+
+def test():
+    """
+    Read hand-built data formats and check the stored values,
+    the generated value members and the offset after reading.
+    """
+
+    game_version = (GameEdition("", "TEST", "yes", [], [], [], []), [])
+
+    test_container(game_version)
+    test_continue_read(game_version)
@@ -122,7 +122,9 @@ class GroupMember(ReadMember):
         ]
 
     def format_hash(self, hasher):
-        return self.cls.format_hash(hasher)
+        # the referenced class is hashed by GenieStructure.format_hash(),
+        # as its data format depends on the game version.
+        return hasher
 
     def __repr__(self):
         return "GroupMember<%s>" % repr(self.cls)
@@ -604,6 +606,10 @@ class MultisubtypeMember(RefMember, DynLengthMember):
         self.class_lookup = class_lookup
 
         # list of member names whose values will be passed to the new class
+        if isinstance(passed_args, str):
+            # a single member name
+            passed_args = frozenset((passed_args,))
+
         self.passed_args = passed_args
 
         # add this member name's value to the filename
@@ -804,8 +810,8 @@ class MultisubtypeMember(RefMember, DynLengthMember):
         hasher = RefMember.format_hash(self, hasher)
         hasher = DynLengthMember.format_hash(self, hasher)
 
-        for _, subtype_class in sorted(self.class_lookup.items()):
-            hasher = subtype_class.format_hash(hasher)
+        # the subtype classes are hashed by GenieStructure.format_hash(),
+        # as their data format depends on the game version.
 
         return hasher
 
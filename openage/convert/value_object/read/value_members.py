@@ -378,15 +378,29 @@ class ArrayMember(ValueMember):
     Stores an ordered list of members with the same type.
     """
 
-    __slots__ = ('_allowed_member_type')
+    __slots__ = ('_allowed_member_type', '_members', '_member_type', '_values')
 
-    def __init__(self, name, allowed_member_type, members):
+    def __init__(self, name, allowed_member_type, members, member_type=None):
+        """
+        :param members: Members stored in the array. If member_type is
+                        given, the raw values for these members instead.
+        :type members: list, tuple
+        :param member_type: ValueMember type that is created for each of the
+                            raw values when the array is accessed the first time.
+        :type member_type: type
+        """
         super().__init__(name)
 
-        self.value = members
-
         self._allowed_member_type = allowed_member_type
 
+        if member_type is not None:
+            self._members = None
+            self._member_type = member_type
+            self._values = members
+            return
+
+        self.value = members
+
         # Check if members have correct type
         for member in members:
             if not isinstance(member, (NoDiffMember, LeftMissingMember, RightMissingMember)):
@@ -394,6 +408,21 @@ class ArrayMember(ValueMember):
                     raise Exception("%s has type %s, but this ArrayMember only allows %s"
                                     % (member, member.get_type(), allowed_member_type))
 
+    @property
+    def value(self):
+        if self._members is None and self._values is not None:
+            # create the members from the raw values
+            member_type = self._member_type
+            self._members = [member_type(self.name, value) for value in self._values]
+            self._values = None
+
+        return self._members
+
+    @value.setter
+    def value(self, members):
+        self._members = members
+        self._values = None
+
     def get_value(self):
         return self.value
 
@@ -506,6 +535,9 @@ class ArrayMember(ValueMember):
         return self.get_value()[key]
 
     def __len__(self):
+        if self._members is None and self._values is not None:
+            return len(self._values)
+
         return len(self.value)
 
     def __repr__(self):
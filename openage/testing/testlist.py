@@ -26,6 +26,8 @@ def tests_py():
     yield "openage.assets.test"
     yield ("openage.cabextract.test.test", "test CAB archive extraction",
            lambda env: env["has_assets"])
+    yield ("openage.convert.entity_object.conversion.test.test",
+           "read hand-built data formats with GenieStructure")
     yield "openage.convert.service.init.changelog.test"
     yield "openage.cppinterface.exctranslate_tests.cpp_to_py"
     yield ("openage.cppinterface.exctranslate_tests.cpp_to_py_bounce",